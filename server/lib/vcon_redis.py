@@ -36,3 +36,17 @@ class VconRedis:
             return None
         _vcon = vcon.Vcon(vcon_dict)
         return _vcon
+
+    def get_vcons(self, vcon_ids: list[str]) -> list[Optional[vcon.Vcon]]:
+        """Retrieves the vcons from redis for given vcon_ids, in a single round trip
+
+        Args:
+            vcon_ids (list[str]): vcon ids
+
+        Returns:
+            list[Optional[vcon.Vcon]]: Returns the vcons, in the order of vcon_ids, with None for any vcon not present.
+        """
+        pipe = redis.json().pipeline(transaction=False)
+        for vcon_id in vcon_ids:
+            pipe.get(f"vcon:{vcon_id}", Path.root_path())
+        return [vcon.Vcon(vcon_dict) if vcon_dict else None for vcon_dict in pipe.execute()]
@@ -1,9 +1,15 @@
+import json
+import orjson
 import os
-import requests
-from datetime import datetime, timedelta, timezone
+import threading
+import time
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from fastapi import HTTPException
 from lib.vcon_redis import VconRedis
 from lib.logging_utils import init_logger
+from redis_mgr import redis
 from starlette.status import HTTP_404_NOT_FOUND, HTTP_501_NOT_IMPLEMENTED
 from vcon import Vcon
 
@@ -13,6 +19,14 @@ logger = init_logger(__name__)
 link_type = "DataTrails"
 link_version = "0.3.0"
 
+# Prefix of the Redis keys caching DataTrails Asset ids,
+# one key per api_url, client_id and asset attributes
+ASSET_ID_CACHE_PREFIX = "vcon:datatrails:asset_id"
+
+# Prefix of the Redis keys holding the last vCon hash recorded as a DataTrails Event,
+# one key per api_url, client_id, vcon_uuid and vcon_operation
+LAST_EVENT_HASH_PREFIX = "vcon:datatrails:last_event_hash"
+
 # NOTE: Once DataTrails removes the dependency for assets,
 #       "asset_attributes" will be removed
 
@@ -27,12 +41,86 @@ default_options = {
     "api_url": "https://app.datatrails.ai/archivist",
     "auth_url": "https://app.datatrails.ai/archivist/iam/v1/appidp/token",
     "partner_id": "not-set",
+    "force": False,
+    # vCons expire from Redis, so the last recorded hash of each vCon expires too
+    "last_event_hash_expires": 60 * 60 * 24 * 7,
+    # Assets are shared by a day of vCons, so a cached asset_id is only kept for a day
+    "asset_id_expires": 60 * 60 * 24,
     "asset_attributes": {
         "arc_display_type": "vcon_droid",
         "conserver_link_version": link_version
     },
 }
 
+# A single HTTP/2 client is shared by every thread, as httpx.Client is thread safe.
+# Requests to DataTrails are multiplexed over one kept-alive TLS connection,
+# across calls, and across vCons processed by the same worker
+_client: httpx.Client | None = None
+_client_lock = threading.Lock()
+
+
+def _get_client() -> httpx.Client:
+    """
+    Get the process wide httpx.Client, creating it on first use
+
+    Returns:
+        httpx.Client: An HTTP/2 client with a pooled, retrying transport
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                limits = httpx.Limits(max_keepalive_connections=8, max_connections=64)
+                _client = httpx.Client(
+                    # transport retries only apply to failed connection attempts,
+                    # gateway errors are retried by the idempotent requests, see _get_with_retries
+                    transport=httpx.HTTPTransport(http2=True, limits=limits, retries=3),
+                    headers={
+                        "User-Agent": "vcon-conserver",
+                        "DataTrails-User-Agent": f"oss/conserverlink/{link_version}",
+                    },
+                    timeout=30.0,
+                )
+    return _client
+
+
+# Gateway errors retried for idempotent requests, and the backoff between attempts
+RETRY_STATUS_CODES = (502, 503, 504)
+RETRY_TOTAL = 3
+RETRY_BACKOFF_FACTOR = 0.2
+
+
+def _get_with_retries(url: str, **kwargs) -> httpx.Response:
+    """
+    Send a GET request, retrying gateway errors with an exponential backoff
+
+    POST requests are not retried, as they would create duplicate Assets or Events.
+
+    Args:
+        url (str): URL to request
+        **kwargs: Arguments passed to httpx.Client.get
+
+    Returns:
+        httpx.Response: The response of the last attempt
+    """
+    for attempt in range(RETRY_TOTAL):
+        response = _get_client().get(url, **kwargs)
+        if response.status_code not in RETRY_STATUS_CODES:
+            return response
+        logger.info(f"DataTrails: Retrying GET {url}, status: {response.status_code}")
+        time.sleep(RETRY_BACKOFF_FACTOR * (2 ** attempt))
+    return _get_client().get(url, **kwargs)
+
+
+# The link runner calls run() synchronously,
+# so independent network calls within a run are overlapped on this pool
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="datatrails")
+
+# run() creates a DataTrailsAuth per vCon, so tokens are cached process wide,
+# keyed by (auth_url, client_id), and shared by every DataTrailsAuth instance
+_token_cache: dict[tuple[str, str], tuple[str, float]] = {}
+_token_lock = threading.Lock()
+
 
 class DataTrailsAuth:
     """
@@ -52,7 +140,8 @@ class DataTrailsAuth:
         self.client_id = client_id
         self.client_secret = client_secret
         self.token = None
-        self.token_expiry = None
+        # time.monotonic() deadline, unaffected by wall clock changes
+        self._token_deadline = 0.0
 
     def get_token(self):
         """
@@ -61,26 +150,67 @@ class DataTrailsAuth:
         Returns:
             str: A valid authentication token.
         """
-        if self.token is None or datetime.now() >= self.token_expiry:
-            self._refresh_token()
+        if self.token is None or time.monotonic() >= self._token_deadline:
+            self._load_token()
         return self.token
 
+    def _load_token(self):
+        """
+        Use the process wide cached token, refreshing it if missing or expired
+        """
+        key = (self.auth_url, self.client_id)
+        cached = _token_cache.get(key)
+        if cached is None or time.monotonic() >= cached[1]:
+            with _token_lock:
+                # Another thread may have refreshed the token while we waited
+                cached = _token_cache.get(key)
+                if cached is None or time.monotonic() >= cached[1]:
+                    self._refresh_token()
+                    return
+        self.token, self._token_deadline = cached
+
     def _refresh_token(self):
         """
-        Refresh the authentication token and update the token file
+        Refresh the authentication token and update the process wide cache
         """
         data = {
             "grant_type": "client_credentials",
             "client_id": self.client_id,
             "client_secret": self.client_secret,
         }
-        response = requests.post(self.auth_url, data=data)
+        response = _get_client().post(self.auth_url, data=data)
         response.raise_for_status()
         token_data = response.json()
 
         self.token = token_data["access_token"]
         # Set token expiry to 5 minutes before actual expiry for safety
-        self.token_expiry = datetime.now() + timedelta(seconds=token_data["expires_in"] - 300)
+        self._token_deadline = time.monotonic() + token_data["expires_in"] - 300
+        _token_cache[(self.auth_url, self.client_id)] = (self.token, self._token_deadline)
+
+
+class DataTrailsBearer(httpx.Auth):
+    """
+    Attaches the DataTrails bearer token to each request, fetching it when the request is sent
+    """
+
+    def __init__(self, auth):
+        """
+        Initialize the DataTrailsBearer object
+
+        Args:
+            auth (DataTrailsAuth): Authentication object for DataTrails API
+        """
+        self.auth = auth
+
+    def auth_flow(self, request):
+        """
+        Set the Authorization header of the request
+
+        Args:
+            request (httpx.Request): The request to authenticate
+        """
+        request.headers["Authorization"] = f"Bearer {self.auth.get_token()}"
+        yield request
 
 
 #    NOTE: Once DataTrails removes the dependency for assets,
@@ -107,15 +237,9 @@ def get_asset_by_attributes(opts: dict, auth: DataTrailsAuth, attributes: dict)
         dict: Data of the found asset
 
     Raises:
-        requests.HTTPError: If the API request fails
+        httpx.HTTPStatusError: If the API request fails
     """
     api_url = opts["api_url"]
-    headers = {
-        "Authorization": f"Bearer {auth.get_token()}",
-        "DataTrails-User-Agent": f"oss/conserverlink/{link_version}",
-        "DataTrails-Partner-ID": opts["partner_id"],
-        "Content-Type": "application/json",
-    }
 
     # Searching DataTrails Assets by attributes requires
     # each attribute to be prepended with "attribute."
@@ -123,7 +247,12 @@ def get_asset_by_attributes(opts: dict, auth: DataTrailsAuth, attributes: dict)
     for param in attributes:
         params.update({f"attributes.{param}": f"{attributes[param]}"})
 
-    response = requests.get(f"{api_url}/v2/assets", params=params, headers=headers)
+    response = _get_with_retries(
+        f"{api_url}/v2/assets",
+        params=params,
+        headers={"DataTrails-Partner-ID": opts["partner_id"]},
+        auth=DataTrailsBearer(auth),
+    )
     response.raise_for_status()
     return response.json()
 
@@ -150,25 +279,24 @@ def create_asset(opts: dict, auth: DataTrailsAuth, attributes: dict) -> dict:
         dict: Data of the created asset
 
     Raises:
-        requests.HTTPError: If the API request fails
+        httpx.HTTPStatusError: If the API request fails
     """
     api_url = opts["api_url"]
     logger.info(f"DataTrails: Creating Asset: {attributes}")
 
-    headers = {
-        "Authorization": f"Bearer {auth.get_token()}",
-        "DataTrails-User-Agent": "oss/conserverlink/" + link_version,
-        "DataTrails-Partner-ID": opts["partner_id"],
-        "Content-Type": "application/json",
-    }
     payload = {
         "behaviours": ["RecordEvidence"],
         "attributes": {**attributes},
         "public": False,
     }
-    response = requests.post(f"{api_url}/v2/assets", headers=headers, json=payload)
+    response = _get_client().post(
+        f"{api_url}/v2/assets",
+        headers={"DataTrails-Partner-ID": opts["partner_id"], "Content-Type": "application/json"},
+        auth=DataTrailsBearer(auth),
+        content=orjson.dumps(payload),
+    )
     if response.status_code == 429:
-        logger.info(f"response.raw: {response.raw}")
+        logger.info(f"response.headers: {response.headers}")
 
     response.raise_for_status()
     return response.json()
@@ -188,20 +316,19 @@ def create_asset_event(opts: dict, asset_id: str, auth: DataTrailsAuth, event_at
         dict: Data of the created Event
 
     Raises:
-        requests.HTTPError: If the API request fails
+        httpx.HTTPStatusError: If the API request fails
     """
-    headers = {
-        "Authorization": f"Bearer {auth.get_token()}",
-        "DataTrails-User-Agent": "oss/conserverlink/" + link_version,
-        "DataTrails-Partner-ID": opts["partner_id"],
-        "Content-Type": "application/json",
-    }
     api_url = opts["api_url"]
     # event_attributes will map to SCITT headers and
     # a cose-meta-map draft (https://github.com/SteveLasker/draft-lasker-cose-meta-map)
     payload = {"operation": "Record", "behaviour": "RecordEvidence", "event_attributes": {**event_attributes}}
     # logger.info(f"payload: {payload}")
-    response = requests.post(f"{api_url}/v2/{asset_id}/events", headers=headers, json=payload)
+    response = _get_client().post(
+        f"{api_url}/v2/{asset_id}/events",
+        headers={"DataTrails-Partner-ID": opts["partner_id"], "Content-Type": "application/json"},
+        auth=DataTrailsBearer(auth),
+        content=orjson.dumps(payload),
+    )
 
     response.raise_for_status()
     return response.json()
@@ -221,48 +348,36 @@ def create_event(opts: dict, auth: DataTrailsAuth, attributes: dict, trails) ->
         dict: Data of the created Event
 
     Raises:
-        requests.HTTPError: If the API request fails
+        httpx.HTTPStatusError: If the API request fails
     """
-    headers = {
-        "Authorization": f"Bearer {auth.get_token()}",
-        "DataTrails-User-Agent": "oss/conserverlink/" + link_version,
-        "DataTrails-Partner-ID": opts["partner_id"],
-        "Content-Type": "application/json",
-    }
     api_url = opts["api_url"]
     # event_attributes will map to SCITT headers and
     # a cose-meta-map draft (https://github.com/SteveLasker/draft-lasker-cose-meta-map)
     payload = {"attributes": {**attributes}, "trails": trails}
-    response = requests.post(f"{api_url}/v1/events", headers=headers, json=payload)
+    response = _get_client().post(
+        f"{api_url}/v1/events",
+        headers={"DataTrails-Partner-ID": opts["partner_id"], "Content-Type": "application/json"},
+        auth=DataTrailsBearer(auth),
+        content=orjson.dumps(payload),
+    )
 
     response.raise_for_status()
     return response.json()
 
 
-def run(vcon_uuid: str, link_name: str, opts: dict = default_options) -> str:
+def _get_auth(opts: dict) -> DataTrailsAuth:
     """
-    Main function to run the DataTrails asset link.
-
-    This function creates or updates an asset in DataTrails based on the vCon data,
-    and records an event for the asset.
+    Create the DataTrailsAuth object for the configured auth type
 
     Args:
-        vcon_uuid (str): UUID of the vCon to process.
-        link_name (str): Name of the link (for logging purposes).
-        opts (dict): Options for the link, including API URLs and credentials.
+        opts (dict): Options for the link, including the auth configuration.
 
     Returns:
-        str: The UUID of the processed vCon.
+        DataTrailsAuth: Authentication object for DataTrails API
 
     Raises:
-        ValueError: If client_id or client_secret is not provided in the options.
+        HTTPException: If the auth configuration is missing or not supported
     """
-    logger.info(f"DataTrails: Starting Link for vCon: {vcon_uuid}")
-
-    merged_opts = default_options.copy()
-    merged_opts.update(opts)
-    opts = merged_opts
-
     try:
         auth_type = opts["auth"]["type"]
     except:
@@ -271,42 +386,107 @@ def run(vcon_uuid: str, link_name: str, opts: dict = default_options) -> str:
         )
 
     if auth_type.lower() == "oidc-client-credentials":
-        auth = DataTrailsAuth(opts["auth"]["token_endpoint"], opts["auth"]["client_id"], opts["auth"]["client_secret"])
+        return DataTrailsAuth(opts["auth"]["token_endpoint"], opts["auth"]["client_id"], opts["auth"]["client_secret"])
     else:
         raise HTTPException(
             status_code=HTTP_501_NOT_IMPLEMENTED, detail=f"Auth type not currently supported: {auth_type}"
         )
 
-    # Get the vCon from Redis
-    vcon_redis = VconRedis()
-    vcon = vcon_redis.get_vcon(vcon_uuid)
-    # TODO:
-    # need better vcon retrieval error handling,
-    # as an invalid vCon can be recovered,
-    # allowing the subsequent code to continue
-    # with a malformed vcon object
-    # logger.info(f"vcon: {vcon.to_json()}")
-    if not vcon:
-        logger.info(f"DataTrails: vCon not found: {vcon_uuid}")
-        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=f"vCon not found: {vcon_uuid}")
 
-    # Set the subject to the vcon identifier
-    subject = f"vcon://{vcon_uuid}"
+def _get_vcon_operation(opts: dict) -> str:
+    """
+    Get the configured vcon_operation, normalized to a "vcon_" prefix
 
-    #####################
-    # ASSET REMOVAL_BEGIN
-    # Everything from here to ASSET REMOVAL_END
-    # will be removed once Assets are removed from the DataTrails API
-    #####################
+    Args:
+        opts (dict): Options for the link, including the vcon_operation.
 
-    # Get the base attributes
-    asset_attributes = opts["asset_attributes"].copy()
+    Returns:
+        str: The vcon_operation, prefixed with "vcon_"
+    """
+    operation = opts["vcon_operation"] or "vcon"
+    # default to "vcon_" prefix, assuring no duplicates, or alternates with "-"
+    return "vcon_" + operation.lower().removeprefix("vcon_").lower().removeprefix("vcon-")
+
+
+def _get_last_event_key(opts: dict, vcon_uuid: str, vcon_operation: str) -> str:
+    """
+    Get the Redis key of the last recorded vCon hash, unique per DataTrails tenant, vCon and operation
 
+    Args:
+        opts (dict): Options for the link, including the api_url and auth client_id.
+        vcon_uuid (str): UUID of the vCon.
+        vcon_operation (str): The normalized vcon_operation, from _get_vcon_operation.
+
+    Returns:
+        str: The Redis key of the last recorded vCon hash
+    """
+    return f"{LAST_EVENT_HASH_PREFIX}:{opts['api_url']}|{opts['auth']['client_id']}|{vcon_uuid}|{vcon_operation}"
+
+
+def _get_asset_attributes(opts: dict) -> dict:
+    """
+    Get the attributes of the DataTrails Asset shared by the current day of vCons
+
+    NOTE: Once DataTrails removes the dependency for assets,
+    this method can be removed
+
+    Args:
+        opts (dict): Options for the link, including the asset_attributes.
+
+    Returns:
+        dict: The asset_attributes, with the droid_id of the current day
+    """
     # An arbitrary ID to temporarily associate DataTrails Events with an Asset
     droid_id = datetime.now(timezone.utc).date().isoformat()
 
-    # Add the temp id to associate a batch of events
-    asset_attributes.update({"droid_id": droid_id})
+    # The base attributes, with the temp id to associate a batch of events
+    return {**opts["asset_attributes"], "droid_id": droid_id}
+
+
+def _get_asset_cache_key(opts: dict, asset_attributes: dict) -> str:
+    """
+    Get the Redis key caching the id of the DataTrails Asset with the given attributes
+
+    NOTE: Once DataTrails removes the dependency for assets,
+    this method can be removed
+
+    Args:
+        opts (dict): Options for the link, including the api_url and auth client_id.
+        asset_attributes (dict): Attributes of the Asset, from _get_asset_attributes.
+
+    Returns:
+        str: The Redis key caching the Asset id
+    """
+    return (
+        f"{ASSET_ID_CACHE_PREFIX}:{opts['api_url']}|{opts['auth']['client_id']}|"
+        f"{json.dumps(asset_attributes, sort_keys=True)}"
+    )
+
+
+def _get_asset_id(
+    opts: dict, auth: DataTrailsAuth, asset_attributes: dict, asset_cache_key: str, cached_asset_id: str | None
+) -> str:
+    """
+    Get the id of the DataTrails Asset shared by the current day of vCons, creating it if needed
+
+    NOTE: Once DataTrails removes the dependency for assets,
+    this method can be removed
+
+    Args:
+        opts (dict): Options for the link, including API URLs and credentials.
+        auth (DataTrailsAuth): Authentication object for DataTrails API
+        asset_attributes (dict): Attributes of the Asset, from _get_asset_attributes
+        asset_cache_key (str): Redis key caching the Asset id, from _get_asset_cache_key
+        cached_asset_id (str | None): The Asset id read from asset_cache_key, if any
+
+    Returns:
+        str: The DataTrails Asset id
+    """
+    # Assets are shared by a day of vCons, so the asset_id is cached in Redis,
+    # avoiding a search of DataTrails Assets for every vCon
+    if cached_asset_id:
+        logger.info(f"DataTrails: Asset found in cache: {cached_asset_id}")
+        return cached_asset_id
 
     # Search for an existing Asset, using
     #   - arc_display_type
@@ -325,23 +505,46 @@ def run(vcon_uuid: str, link_name: str, opts: dict = default_options) -> str:
     if not asset_id:
         logger.info(f"DataTrails: Asset not found: {asset_id}")
 
-        # Prepare attributes
-        asset_attributes = opts["asset_attributes"].copy()
-        asset_attributes.update({"droid_id": droid_id})
-
         asset = create_asset(opts, auth, asset_attributes)
         asset_id = asset["identity"]
 
     else:
         logger.info(f"DataTrails: Asset found: {asset_id}")
 
-    #####################
-    # ASSET REMOVAL_END
-    #####################
+    redis.set(asset_cache_key, asset_id, ex=opts["asset_id_expires"])
+    return asset_id
 
-    ###########################
-    # Create a DataTrails Event
-    ###########################
+
+def _record_events(
+    opts: dict,
+    auth: DataTrailsAuth,
+    link_name: str,
+    vcon_uuid: str,
+    vcon: Vcon,
+    vcon_hash: str,
+    asset_id: str,
+    asset_cache_key: str,
+):
+    """
+    Create the Asset based DataTrails Event for a vCon, followed by the Asset Free Event
+
+    Args:
+        opts (dict): Options for the link, including API URLs and credentials.
+        auth (DataTrailsAuth): Authentication object for DataTrails API.
+        link_name (str): Name of the link, recorded in the Event.
+        vcon_uuid (str): UUID of the vCon to record.
+        vcon (Vcon): The vCon to record.
+        vcon_hash (str): Hash of the vCon, recorded as the Event payload.
+        asset_id (str): ID of the asset to associate the Event with.
+        asset_cache_key (str): Redis key caching the Asset id, dropped if the Asset is not found.
+
+    Raises:
+        httpx.HTTPStatusError: If the Asset based Event creation fails
+    """
+    vcon_operation = _get_vcon_operation(opts)
+
+    # Set the subject to the vcon identifier
+    subject = f"vcon://{vcon_uuid}"
 
     # payload_hash_alg, payload_preimage_content_type are consistent with
     # cose-hash-envelope: https://datatracker.ietf.org/doc/draft-steele-cose-hash-envelope
@@ -349,17 +552,13 @@ def run(vcon_uuid: str, link_name: str, opts: dict = default_options) -> str:
     # additional metadata properties, consistent with
     # cose-draft-lasker-meta-map: https://github.com/SteveLasker/cose-draft-lasker-meta-map
 
-    operation = opts["vcon_operation"] or "vcon"
-    # default to "vcon_" prefix, assuring no duplicates, or alternates with "-"
-    vcon_operation = "vcon_" + operation.lower().removeprefix("vcon_").lower().removeprefix("vcon-")
-
     event_attributes = {
         "arc_display_type": vcon_operation,
         "arc_event_type": vcon_operation,
         "conserver_link": link_type,
         "conserver_link_name": link_name,
         "conserver_link_version": link_version,
-        "payload": vcon.hash,
+        "payload": vcon_hash,
         "payload_hash_alg": "SHA-256",
         "payload_preimage_content_type": "application/vcon+json",
         "subject": subject,
@@ -382,11 +581,19 @@ def run(vcon_uuid: str, link_name: str, opts: dict = default_options) -> str:
     #     }
     # )
 
-    event = create_asset_event(opts, asset_id, auth, event_attributes)
+    try:
+        event = create_asset_event(opts, asset_id, auth, event_attributes)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == HTTP_404_NOT_FOUND:
+            # The cached Asset is gone, so the next run searches for, or creates, another
+            redis.delete(asset_cache_key)
+        raise
     event_id = event["identity"]
     logger.info(f"DataTrails: Event Created: {event_id}")
 
     # Asset Free Events
+    # only created once the Asset based Event succeeds,
+    # so a retried chain doesn't leave extra Asset Free Events behind
     try:
         # during preview, Asset-free events are for DataTrails testing
         # wrapped in a try/catch to avoid errors bubbling up to the conserver
@@ -398,6 +605,182 @@ def run(vcon_uuid: str, link_name: str, opts: dict = default_options) -> str:
         logger.info(f"DataTrails: New Event Creation Failure")
 
 
+def run(vcon_uuid: str, link_name: str, opts: dict = default_options) -> str:
+    """
+    Main function to run the DataTrails asset link.
+
+    This function creates or updates an asset in DataTrails based on the vCon data,
+    and records an event for the asset.
+
+    Args:
+        vcon_uuid (str): UUID of the vCon to process.
+        link_name (str): Name of the link (for logging purposes).
+        opts (dict): Options for the link, including API URLs and credentials.
+
+    Returns:
+        str: The UUID of the processed vCon.
+
+    Raises:
+        ValueError: If client_id or client_secret is not provided in the options.
+    """
+    logger.info(f"DataTrails: Starting Link for vCon: {vcon_uuid}")
+
+    opts = {**default_options, **opts}
+    auth = _get_auth(opts)
+
+    # Fetch the token while the vCon is read from Redis
+    token_future = _executor.submit(auth.get_token)
+
+    # Get the vCon from Redis
+    vcon_redis = VconRedis()
+    vcon = vcon_redis.get_vcon(vcon_uuid)
+    # TODO:
+    # need better vcon retrieval error handling,
+    # as an invalid vCon can be recovered,
+    # allowing the subsequent code to continue
+    # with a malformed vcon object
+    # logger.info(f"vcon: {vcon.to_json()}")
+    if not vcon:
+        logger.info(f"DataTrails: vCon not found: {vcon_uuid}")
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=f"vCon not found: {vcon_uuid}")
+
+    # Vcon.hash serializes and hashes the whole vCon on each access
+    vcon_hash = vcon.hash
+
+    last_event_key = _get_last_event_key(opts, vcon_uuid, _get_vcon_operation(opts))
+    # NOTE: Once DataTrails removes the dependency for assets,
+    #       the Asset attributes and cache key can be removed
+    asset_attributes = _get_asset_attributes(opts)
+    asset_cache_key = _get_asset_cache_key(opts, asset_attributes)
+
+    # Read the last recorded hash and the cached Asset id in a single round trip
+    pipe = redis.pipeline(transaction=False)
+    pipe.get(last_event_key)
+    pipe.get(asset_cache_key)
+    recorded_hash, cached_asset_id = pipe.execute()
+
+    # Recording an unchanged vCon again adds nothing to the ledger,
+    # so reruns and replays of the same operation are skipped
+    if not opts["force"] and recorded_hash == vcon_hash:
+        logger.info(f"DataTrails: vCon unchanged since last Event: {vcon_uuid}")
+        return vcon_uuid
+
+    # Surface any token errors before calling the DataTrails APIs
+    token_future.result()
+
+    #####################
+    # ASSET REMOVAL_BEGIN
+    # Everything from here to ASSET REMOVAL_END
+    # will be removed once Assets are removed from the DataTrails API
+    #####################
+
+    asset_id = _get_asset_id(opts, auth, asset_attributes, asset_cache_key, cached_asset_id)
+
+    #####################
+    # ASSET REMOVAL_END
+    #####################
+
+    ###########################
+    # Create a DataTrails Event
+    ###########################
+
+    _record_events(opts, auth, link_name, vcon_uuid, vcon, vcon_hash, asset_id, asset_cache_key)
+    redis.set(last_event_key, vcon_hash, ex=opts["last_event_hash_expires"])
+
     # TODO: may want to store the receipt/transparent statement in the vCon, in the future
 
     return vcon_uuid
+
+
+def run_batch(vcon_uuids: list[str], link_name: str, opts: dict = default_options) -> list[str]:
+    """
+    Run the DataTrails asset link for a batch of vCons.
+
+    The vCons and their last recorded hashes are each read from Redis in one round trip,
+    the DataTrails Asset shared by the batch is resolved once, the Events of every vCon
+    are created concurrently, and the recorded hashes are written back in one round trip.
+
+    Args:
+        vcon_uuids (list[str]): UUIDs of the vCons to process.
+        link_name (str): Name of the link (for logging purposes).
+        opts (dict): Options for the link, including API URLs and credentials.
+
+    Returns:
+        list[str]: The UUIDs of the processed vCons, skipping any vCons not found.
+    """
+    logger.info(f"DataTrails: Starting Link for {len(vcon_uuids)} vCons")
+
+    opts = {**default_options, **opts}
+    auth = _get_auth(opts)
+
+    # Fetch the token while the vCons are read from Redis
+    token_future = _executor.submit(auth.get_token)
+
+    vcons = VconRedis().get_vcons(vcon_uuids)
+    vcon_operation = _get_vcon_operation(opts)
+    last_event_keys = [_get_last_event_key(opts, vcon_uuid, vcon_operation) for vcon_uuid in vcon_uuids]
+    asset_attributes = _get_asset_attributes(opts)
+    asset_cache_key = _get_asset_cache_key(opts, asset_attributes)
+
+    # Read the last recorded hashes and the cached Asset id in a single round trip
+    *recorded_hashes, cached_asset_id = redis.mget([*last_event_keys, asset_cache_key])
+    if opts["force"]:
+        recorded_hashes = [None] * len(vcon_uuids)
+
+    processed = []
+    pending = []
+    for vcon_uuid, vcon, last_event_key, recorded_hash in zip(vcon_uuids, vcons, last_event_keys, recorded_hashes):
+        if not vcon:
+            logger.info(f"DataTrails: vCon not found: {vcon_uuid}")
+            continue
+        processed.append(vcon_uuid)
+
+        vcon_hash = vcon.hash
+        if recorded_hash == vcon_hash:
+            logger.info(f"DataTrails: vCon unchanged since last Event: {vcon_uuid}")
+            continue
+        pending.append((vcon_uuid, vcon, vcon_hash, last_event_key))
+
+    if not pending:
+        return processed
+
+    # Surface any token errors before calling the DataTrails APIs
+    token_future.result()
+
+    # Assets are shared by a day of vCons, so a single Asset serves the batch
+    asset_id = _get_asset_id(opts, auth, asset_attributes, asset_cache_key, cached_asset_id)
+
+    # The Events of each vCon are independent of the other vCons,
+    # so the vCons are recorded concurrently
+    submitted = [
+        (
+            last_event_key,
+            vcon_hash,
+            _executor.submit(
+                _record_events, opts, auth, link_name, vcon_uuid, vcon, vcon_hash, asset_id, asset_cache_key
+            ),
+        )
+        for vcon_uuid, vcon, vcon_hash, last_event_key in pending
+    ]
+    # Wait for every vCon, so the hashes of all recorded vCons are kept,
+    # even when the Events of another vCon in the batch fail
+    recorded = {}
+    first_error = None
+    for last_event_key, vcon_hash, future in submitted:
+        try:
+            future.result()
+        except Exception as e:
+            first_error = first_error or e
+        else:
+            recorded[last_event_key] = vcon_hash
+
+    if recorded:
+        pipe = redis.pipeline(transaction=False)
+        for last_event_key, vcon_hash in recorded.items():
+            pipe.set(last_event_key, vcon_hash, ex=opts["last_event_hash_expires"])
+        pipe.execute()
+
+    if first_error:
+        raise first_error
+
+    return processed
@@ -1,15 +1,21 @@
 from typing import Any, Generator
+import httpx
 import pytest
 from unittest.mock import Mock, patch
-from datetime import datetime, timedelta
 import json
+import time
 
 # Import the functions and classes we want to test
 from . import (
+    ASSET_ID_CACHE_PREFIX,
+    LAST_EVENT_HASH_PREFIX,
     DataTrailsAuth,
+    _token_cache,
     create_asset,
     create_event,
-    run
+    get_asset_by_attributes,
+    run,
+    run_batch
 )
 
 # Mock VconRedis class
@@ -22,16 +28,21 @@ class MockVconRedis:
                 "asset_attributes": '{"test": "asset"}' if x == "asset_attributes" else "{}"
             }.get(x)),
             subject="vcon://abc123",
+            hash="vcon-hash",
             add_tag=Mock()
         )
     
+    def get_vcons(self, vcon_ids):
+        return [self.get_vcon(vcon_id) for vcon_id in vcon_ids]
+
     def store_vcon(self, vcon):
         pass
 
 @pytest.fixture
 def mock_auth() -> Generator[DataTrailsAuth, Any, None]:
-    with patch('server.links.datatrails.requests.post') as mock_post:
-        mock_post.return_value.json.return_value = {
+    _token_cache.clear()
+    with patch(f'{__package__}._get_client') as mock_get_client:
+        mock_get_client.return_value.post.return_value.json.return_value = {
             "access_token": "test_token",
             "expires_in": 3600
         }
@@ -41,17 +52,31 @@ def mock_auth() -> Generator[DataTrailsAuth, Any, None]:
 def test_datatrails_auth_get_token(mock_auth):
     token = mock_auth.get_token()
     assert token == "test_token"
-    assert mock_auth.token_expiry > datetime.now()
+    assert mock_auth._token_deadline > time.monotonic()
 
 def test_datatrails_auth_refresh_token(mock_auth):
-    mock_auth.token_expiry = datetime.now() - timedelta(minutes=5)
+    mock_auth._token_deadline = time.monotonic() - 300
     token = mock_auth.get_token()
     assert token == "test_token"
-    assert mock_auth.token_expiry > datetime.now()
+    assert mock_auth._token_deadline > time.monotonic()
+
+
+def test_datatrails_auth_shares_token_across_instances(mock_auth):
+    with patch(f'{__package__}._get_client') as mock_get_client:
+        mock_post = mock_get_client.return_value.post
+        mock_post.return_value.json.return_value = {
+            "access_token": "test_token",
+            "expires_in": 3600
+        }
+        assert mock_auth.get_token() == "test_token"
+        other_auth = DataTrailsAuth("http://test.com", "test_id", "test_secret")
+        assert other_auth.get_token() == "test_token"
+        mock_post.assert_called_once()
 
 
 def test_create_asset(mock_auth):
-    with patch('server.links.datatrails.requests.post') as mock_post:
+    with patch(f'{__package__}._get_client') as mock_get_client:
+        mock_post = mock_get_client.return_value.post
         mock_post.return_value.json.return_value = {
             "id": "new_asset",
             "access_token": "test_token",
@@ -68,3 +93,133 @@ def test_create_asset(mock_auth):
             "expires_in": 3600
         }
         mock_post.assert_called()
+
+
+def test_get_asset_by_attributes_retries_gateway_errors(mock_auth):
+    with patch(f'{__package__}._get_client') as mock_get_client, patch(f'{__package__}.time.sleep'):
+        mock_get = mock_get_client.return_value.get
+        mock_get.side_effect = [Mock(status_code=503), Mock(status_code=200, json=Mock(return_value={"assets": []}))]
+        result = get_asset_by_attributes(
+            opts={"api_url": "http://test.com", "partner_id": "foo"},
+            auth=mock_auth,
+            attributes={"name": "Test"}
+        )
+        assert result == {"assets": []}
+        assert mock_get.call_count == 2
+
+
+API_URL = "https://app.datatrails.ai/archivist"
+
+RUN_OPTS = {
+    "vcon_operation": "vcon_created",
+    "auth": {
+        "type": "OIDC-client-credentials",
+        "token_endpoint": "http://test.com/token",
+        "client_id": "test_id",
+        "client_secret": "test_secret",
+    },
+}
+
+
+@pytest.fixture
+def run_mocks() -> Generator[dict, Any, None]:
+    _token_cache.clear()
+    with patch(f'{__package__}._get_client') as mock_get_client, \
+            patch(f'{__package__}.VconRedis', MockVconRedis), \
+            patch(f'{__package__}.redis') as mock_redis, \
+            patch(f'{__package__}.get_asset_by_attributes') as mock_get_asset, \
+            patch(f'{__package__}.create_asset_event') as mock_asset_event, \
+            patch(f'{__package__}.create_event') as mock_event:
+        mock_get_client.return_value.post.return_value.json.return_value = {
+            "access_token": "test_token",
+            "expires_in": 3600
+        }
+        mock_redis.pipeline.return_value.execute.return_value = [None, None]
+        mock_redis.mget.side_effect = lambda keys: [None] * len(keys)
+        mock_get_asset.return_value = {"assets": [{"identity": "assets/droid"}]}
+        mock_asset_event.return_value = {"identity": "assets/droid/events/1"}
+        mock_event.return_value = {"identity": "events/1"}
+        yield {
+            "redis": mock_redis,
+            "get_asset_by_attributes": mock_get_asset,
+            "create_asset_event": mock_asset_event,
+            "create_event": mock_event,
+        }
+
+
+def test_run_creates_asset_and_asset_free_events(run_mocks):
+    assert run("abc123", "datatrails_created", RUN_OPTS) == "abc123"
+    run_mocks["create_asset_event"].assert_called_once()
+    run_mocks["create_event"].assert_called_once()
+    run_mocks["redis"].set.assert_any_call(
+        f"{LAST_EVENT_HASH_PREFIX}:{API_URL}|test_id|abc123|vcon_created", "vcon-hash", ex=60 * 60 * 24 * 7
+    )
+    asset_cache_key = run_mocks["redis"].set.call_args_list[0].args[0]
+    assert asset_cache_key.startswith(ASSET_ID_CACHE_PREFIX)
+    run_mocks["redis"].set.assert_any_call(asset_cache_key, "assets/droid", ex=60 * 60 * 24)
+
+
+def test_run_uses_cached_asset_id(run_mocks):
+    run_mocks["redis"].pipeline.return_value.execute.return_value = [None, "assets/cached"]
+
+    assert run("abc123", "datatrails_created", RUN_OPTS) == "abc123"
+    run_mocks["get_asset_by_attributes"].assert_not_called()
+    assert run_mocks["create_asset_event"].call_args.args[1] == "assets/cached"
+    # the last recorded hash and the cached Asset id are read in one pipeline
+    assert run_mocks["redis"].pipeline.return_value.get.call_count == 2
+    run_mocks["redis"].get.assert_not_called()
+
+
+def test_run_drops_cached_asset_id_when_asset_not_found(run_mocks):
+    run_mocks["redis"].pipeline.return_value.execute.return_value = [None, "assets/gone"]
+    run_mocks["create_asset_event"].side_effect = httpx.HTTPStatusError(
+        "Not Found", request=httpx.Request("POST", "http://test.com"), response=httpx.Response(404)
+    )
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run("abc123", "datatrails_created", RUN_OPTS)
+    assert run_mocks["redis"].delete.call_args.args[0].startswith(ASSET_ID_CACHE_PREFIX)
+    # the Asset Free Event is only created once the Asset based Event succeeds
+    run_mocks["create_event"].assert_not_called()
+
+
+def test_run_skips_unchanged_vcon(run_mocks):
+    run_mocks["redis"].pipeline.return_value.execute.return_value = ["vcon-hash", None]
+
+    assert run("abc123", "datatrails_created", RUN_OPTS) == "abc123"
+    run_mocks["create_asset_event"].assert_not_called()
+    run_mocks["create_event"].assert_not_called()
+
+
+def test_run_force_records_unchanged_vcon(run_mocks):
+    run_mocks["redis"].pipeline.return_value.execute.return_value = ["vcon-hash", None]
+
+    assert run("abc123", "datatrails_created", {**RUN_OPTS, "force": True}) == "abc123"
+    run_mocks["create_asset_event"].assert_called_once()
+
+
+def test_run_batch_resolves_asset_once(run_mocks):
+    assert run_batch(["abc123", "def456"], "datatrails_created", RUN_OPTS) == ["abc123", "def456"]
+    run_mocks["get_asset_by_attributes"].assert_called_once()
+    assert run_mocks["create_asset_event"].call_count == 2
+    assert run_mocks["create_event"].call_count == 2
+    run_mocks["redis"].mget.assert_called_once()
+    pipe = run_mocks["redis"].pipeline.return_value
+    assert pipe.set.call_count == 2
+    pipe.set.assert_any_call(
+        f"{LAST_EVENT_HASH_PREFIX}:{API_URL}|test_id|def456|vcon_created", "vcon-hash", ex=60 * 60 * 24 * 7
+    )
+    pipe.execute.assert_called_once()
+
+
+def test_run_batch_keeps_recorded_hashes_on_failure(run_mocks):
+    server_error = httpx.HTTPStatusError(
+        "Server Error", request=httpx.Request("POST", "http://test.com"), response=httpx.Response(500)
+    )
+    run_mocks["create_asset_event"].side_effect = [server_error, {"identity": "assets/droid/events/2"}]
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run_batch(["abc123", "def456"], "datatrails_created", RUN_OPTS)
+    pipe = run_mocks["redis"].pipeline.return_value
+    pipe.set.assert_called_once()
+    pipe.execute.assert_called_once()
@@ -49,9 +49,7 @@ def run(
     """
     module_name = __name__.split(".")[-1]
     logger.info(f"Starting {module_name}: {link_name} plugin for: {vcon_uuid}")
-    merged_opts = default_options.copy()
-    merged_opts.update(opts)
-    opts = merged_opts
+    opts = {**default_options, **opts}
 
     if not opts["client_id"] or not opts["client_secret"]:
         raise ValueError(f"{module_name} client ID and client secret must be provided")
@@ -2,22 +2,18 @@
 # Source: https://github.com/datatrails/datatrails-scitt-samples/blob/main/scitt/create_hashed_signed_statement.py
 
 import argparse
+import functools
 import hashlib
 import json
 #import dump_cbor
 
-from typing import Optional
-from hashlib import sha256
-from pycose.messages import Sign1Message
-from pycose.headers import Algorithm, KID
-from pycose.algorithms import Es256
-from pycose.keys.curves import P256
-from pycose.keys.keyparam import KpKty, EC2KpD, EC2KpX, EC2KpY, KpKeyOps, EC2KpCurve
-from pycose.keys.keytype import KtyEC2
-from pycose.keys.keyops import SignOp, VerifyOp
-from pycose.keys import CoseKey
+from typing import TYPE_CHECKING, Callable, Optional
 
-from ecdsa import SigningKey, VerifyingKey
+# pycose and ecdsa are slow to import, so are imported by the functions using them,
+# keeping worker startup fast when the SCITT link is configured but not invoked
+if TYPE_CHECKING:
+    from pycose.keys import CoseKey
+    from ecdsa import SigningKey, VerifyingKey
 
 # CWT header label comes from version 4 of the scitt architecture document
 # https://www.ietf.org/archive/id/draft-ietf-scitt-architecture-04.html#name-issuer-identity
@@ -48,18 +44,79 @@ HEADER_LABEL_PAYLOAD_PRE_CONTENT_TYPE = -6802
 # key/value pairs of tstr:tstr supporting metadata
 HEADER_LABEL_META_MAP = -6804
 
-def open_signing_key(key_file: str) -> SigningKey:
+# payload_hash_alg names, mapped to their COSE algorithm labels
+HASH_ALG_LABELS = {
+    "SHA-256": HEADER_LABEL_COSE_ALG_SHA256,
+    "SHA-384": HEADER_LABEL_COSE_ALG_SHA384,
+    "SHA-512": HEADER_LABEL_COSE_ALG_SHA512,
+    "SHA-512-256": HEADER_LABEL_COSE_ALG_SHA512_256,
+}
+
+def open_signing_key(key_file: str) -> "SigningKey":
     """
     opens the signing key from the key file.
     NOTE: the signing key is expected to be a P-256 ecdsa key in PEM format.
     While this sample script uses P-256 ecdsa, DataTrails supports any format
     supported through [go-cose](https://github.com/veraison/go-cose/blob/main/algorithm.go)
     """
+    from ecdsa import SigningKey
+
     with open(key_file, encoding="UTF-8") as file:
         signing_key = SigningKey.from_pem(file.read(), hashlib.sha256)
         return signing_key
 
 
+@functools.lru_cache(maxsize=16)
+def _key_material(signing_key_pem: bytes) -> tuple[dict, "CoseKey"]:
+    """
+    derives the public key header and cose_key for a signing key.
+    these only depend on the signing key, so are cached by its PEM encoding,
+    for reuse across statements signed with the same key.
+    NOTE: the returned header is shared, and must not be modified.
+    """
+    from ecdsa import SigningKey
+    from pycose.keys import CoseKey
+    from pycose.keys.curves import P256
+    from pycose.keys.keyparam import KpKty, EC2KpD, EC2KpX, EC2KpY, KpKeyOps, EC2KpCurve
+    from pycose.keys.keytype import KtyEC2
+    from pycose.keys.keyops import SignOp, VerifyOp
+
+    signing_key = SigningKey.from_pem(signing_key_pem, hashlib.sha256)
+
+    # NOTE: for the sample an ecdsa P256 key is used
+    verifying_key: Optional["VerifyingKey"] = signing_key.verifying_key
+    assert verifying_key is not None
+
+    # pub key is the x and y parts concatenated
+    xy_parts = verifying_key.to_string()
+
+    # ecdsa P256 is 64 bytes
+    x_part = xy_parts[0:32]
+    y_part = xy_parts[32:64]
+
+    # the verification key attached to the cwt claims
+    cnf_header = {
+        HEADER_LABEL_CNF_COSE_KEY: {
+            KpKty: KtyEC2,
+            EC2KpCurve: P256,
+            EC2KpX: x_part,
+            EC2KpY: y_part,
+        },
+    }
+
+    # create the cose_key to sign the statement using the signing key
+    cose_key = {
+        KpKty: KtyEC2,
+        EC2KpCurve: P256,
+        KpKeyOps: [SignOp, VerifyOp],
+        EC2KpD: signing_key.to_string(),
+        EC2KpX: x_part,
+        EC2KpY: y_part,
+    }
+
+    return cnf_header, CoseKey.from_dict(cose_key)
+
+
 def read_file(payload_file: str) -> str:
     """
     opens the payload from the payload file.
@@ -68,9 +125,25 @@ def read_file(payload_file: str) -> str:
         return file.read()
 
 
+def hash_file(payload_file: str) -> bytes:
+    """
+    returns the sha256 digest of the payload file.
+    the file is hashed in chunks, rather than being read into memory.
+    """
+    with open(payload_file, "rb") as file:
+        # hashlib.file_digest (python 3.11+) reads and hashes in C
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(file, "sha256").digest()
+
+        payload_hash = hashlib.sha256()
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            payload_hash.update(chunk)
+        return payload_hash.digest()
+
+
 def create_hashed_signed_statement(
     issuer: str,
-    signing_key: SigningKey,
+    signing_key: "SigningKey",
     subject: str,
     kid: str = b"testkey",
     meta_map: dict = None,
@@ -83,70 +156,108 @@ def create_hashed_signed_statement(
     creates a hashed signed statement, given the signing_key, payload, subject and issuer
     the payload will be hashed and the hash added to the payload field.
     """
+    statement = {
+        "subject": subject,
+        "payload": payload,
+        "meta_map": meta_map,
+        "payload_location": payload_location,
+    }
+    return create_hashed_signed_statements(
+        issuer=issuer,
+        signing_key=signing_key,
+        statements=[statement],
+        kid=kid,
+        payload_hash_alg=payload_hash_alg,
+        pre_image_content_type=pre_image_content_type,
+    )[0]
 
-    # NOTE: for the sample an ecdsa P256 key is used
-    verifying_key: Optional[VerifyingKey] = signing_key.verifying_key
-    assert verifying_key is not None
 
-    # pub key is the x and y parts concatenated
-    xy_parts = verifying_key.to_string()
+def make_signer(
+    issuer: str,
+    signing_key: "SigningKey",
+    kid: str = b"testkey",
+    payload_hash_alg: str = "SHA-256",
+    pre_image_content_type: str = None,
+) -> Callable[..., bytes]:
+    """
+    returns a sign(subject, payload, meta_map=None, payload_location=None) function,
+    creating hashed signed statements for callers that already hold the payload digest.
+    the key material and the protected header values shared by every statement
+    are resolved once, so each call only adds the per statement values and signs.
+    """
+    from pycose.messages import Sign1Message
+    from pycose.headers import Algorithm, KID
+    from pycose.algorithms import Es256
 
-    # ecdsa P256 is 64 bytes
-    x_part = xy_parts[0:32]
-    y_part = xy_parts[32:64]
+    cnf_header, cose_key = _key_material(signing_key.to_pem())
 
     # Expectation to create a Hashed Envelope
-    match payload_hash_alg:
-        case 'SHA-256':
-            payload_hash_alg_label = HEADER_LABEL_COSE_ALG_SHA256
-        case 'SHA-384':
-            payload_hash_alg_label = HEADER_LABEL_COSE_ALG_SHA384
-        case 'SHA-512':
-            payload_hash_alg_label = HEADER_LABEL_COSE_ALG_SHA512
-
-    # create a protected header where
-    # the verification key is attached to the cwt claims
-    protected_header = {
+    # raises KeyError for an unsupported payload_hash_alg
+    payload_hash_alg_label = HASH_ALG_LABELS[payload_hash_alg]
+
+    # the protected header values common to every statement
+    base_header = {
         Algorithm: Es256,
         KID: kid,
         HEADER_LABEL_PAYLOAD_PRE_CONTENT_TYPE: pre_image_content_type,
-        HEADER_LABEL_CWT: {
-            HEADER_LABEL_CWT_ISSUER: issuer,
-            HEADER_LABEL_CWT_SUBJECT: subject,
-            HEADER_LABEL_CWT_CNF: {
-                HEADER_LABEL_CNF_COSE_KEY: {
-                    KpKty: KtyEC2,
-                    EC2KpCurve: P256,
-                    EC2KpX: x_part,
-                    EC2KpY: y_part,
-                },
-            },
-        },
-        HEADER_LABEL_PAYLOAD_HASH_ALGORITHM: payload_hash_alg_label,
-        HEADER_LABEL_PAYLOAD_LOCATION: payload_location,
-        HEADER_LABEL_META_MAP: meta_map,
     }
-    # create the statement as a sign1 message using the protected header and payload
-    statement = Sign1Message(phdr=protected_header, payload=payload)
 
-    # create the cose_key to sign the statement using the signing key
-    cose_key = {
-        KpKty: KtyEC2,
-        EC2KpCurve: P256,
-        KpKeyOps: [SignOp, VerifyOp],
-        EC2KpD: signing_key.to_string(),
-        EC2KpX: x_part,
-        EC2KpY: y_part,
-    }
+    def sign(subject: str, payload: bytes, meta_map: dict = None, payload_location: str = None) -> bytes:
+        # create a protected header where
+        # the verification key is attached to the cwt claims
+        protected_header = {
+            **base_header,
+            HEADER_LABEL_CWT: {
+                HEADER_LABEL_CWT_ISSUER: issuer,
+                HEADER_LABEL_CWT_SUBJECT: subject,
+                HEADER_LABEL_CWT_CNF: cnf_header,
+            },
+            HEADER_LABEL_PAYLOAD_HASH_ALGORITHM: payload_hash_alg_label,
+            HEADER_LABEL_PAYLOAD_LOCATION: payload_location,
+            HEADER_LABEL_META_MAP: meta_map,
+        }
+        # create the statement as a sign1 message using the protected header and payload
+        statement = Sign1Message(phdr=protected_header, payload=payload)
+        statement.key = cose_key
 
-    cose_key = CoseKey.from_dict(cose_key)
-    statement.key = cose_key
+        # sign and cbor encode the statement.
+        # NOTE: the encode() function performs the signing automatically
+        return statement.encode([None])
 
-    # sign and cbor encode the statement.
-    # NOTE: the encode() function performs the signing automatically
-    signed_statement = statement.encode([None])
+    return sign
 
-    return signed_statement
+
+def create_hashed_signed_statements(
+    issuer: str,
+    signing_key: "SigningKey",
+    statements: list[dict],
+    kid: str = b"testkey",
+    payload_hash_alg: str = "SHA-256",
+    pre_image_content_type: str = None,
+) -> list[bytes]:
+    """
+    creates a hashed signed statement for each of the statements, sharing the
+    issuer, signing_key, kid, payload_hash_alg and pre_image_content_type.
+    each statement is a dict of "subject" and "payload",
+    with optional "meta_map" and "payload_location".
+    the key material and header labels are resolved once for the batch.
+    """
+    sign = make_signer(
+        issuer=issuer,
+        signing_key=signing_key,
+        kid=kid,
+        payload_hash_alg=payload_hash_alg,
+        pre_image_content_type=pre_image_content_type,
+    )
+    return [
+        sign(
+            subject=statement_fields["subject"],
+            payload=statement_fields["payload"],
+            meta_map=statement_fields.get("meta_map"),
+            payload_location=statement_fields.get("payload_location"),
+        )
+        for statement_fields in statements
+    ]
 
 
 def main():
@@ -232,19 +343,20 @@ def main():
     print("meta_map:", meta_map_dict)
 
     signing_key = open_signing_key(args.signing_key_file)
-    payload_contents = read_file(args.payload_file)
-    payload_hash = sha256(payload_contents.encode("utf-8")).digest()
+    payload_hash = hash_file(args.payload_file)
 
-    signed_statement = create_hashed_signed_statement(
+    sign = make_signer(
+        issuer=args.issuer,
+        signing_key=signing_key,
         kid=args.kid,
+        payload_hash_alg="SHA-256",
         pre_image_content_type=args.content_type,
-        issuer = args.issuer,
-        payload_hash_alg = "SHA-256",
-        payload = payload_hash,
-        payload_location=args.payload_location,
-        signing_key=signing_key,
+    )
+    signed_statement = sign(
         subject=args.subject,
+        payload=payload_hash,
         meta_map=meta_map_dict,
+        payload_location=args.payload_location,
     )
 
     with open(args.output_file, "wb") as output_file:
@@ -9,7 +9,6 @@ import sys
 import datetime
 from time import sleep as time_sleep
 
-from pycose.messages import Sign1Message
 import requests
 
 # Increment for any API/attribute changes
@@ -71,7 +70,7 @@ class OIDC_Auth:
 
     def _refresh_token(self):
         """
-        Refresh the authentication token and update the token file
+        Refresh the authentication token and its expiry
         """
         data = {
             "grant_type": "client_credentials",
@@ -240,6 +239,9 @@ def attach_receipt(
     Given a Signed Statement and a corresponding Entry ID, fetch a Receipt from
     the Transparency Service and write out a complete Transparent Statement
     """
+    # imported here, as pycose is slow to import
+    from pycose.messages import Sign1Message
+
     # Get the receipt
     response = requests.get(
         f"https://app.datatrails.ai/archivist/v1/publicscitt/entries/{entry_id}/receipt",
@@ -0,0 +1,84 @@
+import hashlib
+import pytest
+from ecdsa import NIST256p, SigningKey
+from pycose.keys import EC2Key
+from pycose.keys.curves import P256
+from pycose.messages import Sign1Message
+
+from .create_hashed_signed_statement import (
+    HEADER_LABEL_PAYLOAD_HASH_ALGORITHM,
+    HEADER_LABEL_COSE_ALG_SHA256,
+    create_hashed_signed_statement,
+    create_hashed_signed_statements,
+    hash_file,
+    make_signer,
+)
+
+PAYLOAD = hashlib.sha256(b"vcon").digest()
+
+
+@pytest.fixture
+def signing_key() -> SigningKey:
+    return SigningKey.generate(curve=NIST256p, hashfunc=hashlib.sha256)
+
+
+def verify(signed_statement: bytes, signing_key: SigningKey) -> Sign1Message:
+    message = Sign1Message.decode(signed_statement)
+    xy_parts = signing_key.verifying_key.to_string()
+    message.key = EC2Key(crv=P256, x=xy_parts[0:32], y=xy_parts[32:64])
+    assert message.verify_signature()
+    return message
+
+
+def test_make_signer_matches_create_hashed_signed_statement(signing_key):
+    sign = make_signer(
+        issuer="issuer",
+        signing_key=signing_key,
+        kid=b"testkey",
+        pre_image_content_type="application/vcon+json",
+    )
+    signed = sign(subject="vcon://abc123", payload=PAYLOAD, meta_map={"vcon_operation": "vcon_created"})
+    expected = create_hashed_signed_statement(
+        issuer="issuer",
+        signing_key=signing_key,
+        subject="vcon://abc123",
+        kid=b"testkey",
+        meta_map={"vcon_operation": "vcon_created"},
+        payload=PAYLOAD,
+        pre_image_content_type="application/vcon+json",
+    )
+
+    message = verify(signed, signing_key)
+    expected_message = verify(expected, signing_key)
+    assert message.phdr == expected_message.phdr
+    assert message.payload == expected_message.payload == PAYLOAD
+    assert message.phdr[HEADER_LABEL_PAYLOAD_HASH_ALGORITHM] == HEADER_LABEL_COSE_ALG_SHA256
+
+
+def test_create_hashed_signed_statements_verify(signing_key):
+    statements = [
+        {"subject": "vcon://abc123", "payload": PAYLOAD},
+        {"subject": "vcon://def456", "payload": PAYLOAD, "payload_location": "https://example.com/def456"},
+    ]
+    signed_statements = create_hashed_signed_statements(
+        issuer="issuer",
+        signing_key=signing_key,
+        statements=statements,
+    )
+
+    assert len(signed_statements) == 2
+    for signed, statement in zip(signed_statements, statements):
+        assert verify(signed, signing_key).payload == statement["payload"]
+
+
+def test_hash_file_matches_sha256_of_file_bytes(tmp_path):
+    payload_file = tmp_path / "payload.json"
+    payload_file.write_bytes(b'{"vcon": "0.0.1"}\r\n' * 10000)
+
+    with open(payload_file, "rb") as file:
+        assert hash_file(str(payload_file)) == hashlib.sha256(file.read()).digest()
+
+
+def test_unknown_payload_hash_alg_raises(signing_key):
+    with pytest.raises(KeyError):
+        make_signer(issuer="issuer", signing_key=signing_key, payload_hash_alg="MD5")